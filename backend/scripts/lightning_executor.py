@@ -16,32 +16,263 @@ Enhanced with:
 import os
 import sys
 import json
+import re
 import time
-import signal
+import random
+import shlex
+import shutil
 import subprocess
+import types
+import uuid
+from collections import deque
+import tempfile
+import threading
+from typing import Optional, Tuple
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from lightning_sdk import Machine, Studio
 
-# Global timeout handler
+# Optional faster JSON encoder for the final results
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def env_int(name: str, default: int) -> int:
+    """Read a non-negative int from the environment, falling back to default if malformed"""
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except ValueError:
+        print(f"⚠️  Ignoring invalid {name}={os.environ.get(name)!r}, using {default}", file=sys.stderr)
+        return default
+
+# Configuration, read from the environment once at import
+_CFG = types.SimpleNamespace(
+    api_key=os.environ.get('LIGHTNING_API_KEY'),
+    user_id=os.environ.get('LIGHTNING_USER_ID'),
+    username=os.environ.get('LIGHTNING_USERNAME'),  # Username for user parameter
+    teamspace=os.environ.get('LIGHTNING_TEAMSPACE', 'Vision-model'),  # Default to Vision-model
+    use_cli_fallback=os.environ.get('LIGHTNING_USE_CLI_FALLBACK', 'true').lower() == 'true',
+    # Keep the studio running between executions (same project/repo -> same studio)
+    studio_reuse=os.environ.get('LIGHTNING_STUDIO_REUSE', 'false').lower() == 'true',
+    # Race the studio connection approaches instead of trying them one by one
+    parallel_connect=os.environ.get('LIGHTNING_PARALLEL_CONNECT', 'true').lower() == 'true',
+    # Most recent command outputs kept in the results (plus the first failures)
+    max_outputs=env_int('LIGHTNING_MAX_OUTPUTS', 200),
+)
+
+# Standalone command argument marking its neighbours as independent
+PARALLEL_SEPARATOR = '||'
+
+# Sentinels framing each command's output in the remote run script
+SCRIPT_EOF = 'LIGHTNING_RUN_SCRIPT_EOF'
+CMD_OUTPUT_PATTERN = re.compile(r'##CMD_START (\d+)\n(.*?)\n##CMD_END \1 rc=(\d+)', re.S)
+
+# Output kept per step (bytes, from the end); truncation happens on the studio
+CLONE_OUTPUT_LIMIT = 1000
+COMMAND_OUTPUT_LIMIT = 5000
+
+# Earliest failing command outputs always kept, however many commands run
+MAX_FIRST_FAILURES = 10
+
+# Command classification keywords, one compiled pattern per class
+INSTALL_COMMAND_PATTERN = re.compile(r'install|download', re.I)
+TEST_COMMAND_PATTERN = re.compile(r'test', re.I)
+
+# Errors worth retrying: rate limits, server errors, timeouts, dropped connections.
+# Anything else (e.g. 401/403, missing studio) fails fast.
+RETRYABLE_ERROR_PATTERN = re.compile(r'\b(429|500|502|503|504|529)\b|timeout|timed out|connection|temporar', re.I)
+
+# Cached `lightning --version` probe: (available, version), None until first checked
+_CLI_AVAILABLE: Optional[Tuple[bool, str]] = None
+
+# Global timeout error
 class TimeoutError(Exception):
     pass
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("Operation timed out")
+def submit_daemon(func, *args) -> Future:
+    """
+    Run func(*args) in a daemon thread and return its Future.
+    Unlike pool workers, daemon threads are not joined at interpreter exit,
+    so a call that hangs past its timeout can't keep the process alive.
+    """
+    future = Future()
+    
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=runner, daemon=True).start()
+    return future
 
 def run_with_timeout(func, timeout_seconds=300):
-    """Run a function with a timeout"""
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(timeout_seconds)
+    """Run a function with a timeout (thread-safe, unlike SIGALRM)"""
     try:
-        result = func()
-        signal.alarm(0)  # Cancel the alarm
-        return result
-    except TimeoutError:
-        signal.alarm(0)
-        raise
-    except Exception as e:
-        signal.alarm(0)
-        raise
+        return submit_daemon(func).result(timeout=timeout_seconds)
+    except FutureTimeoutError:
+        raise TimeoutError("Operation timed out")
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether an error looks transient (timeout/429/5xx/connection)"""
+    return bool(RETRYABLE_ERROR_PATTERN.search(str(error)))
+
+def retry(func, attempts=3, base=2, cap=60):
+    """
+    Call func, retrying retryable errors with exponential backoff and jitter.
+    Sleeps min(cap, uniform(base, 2*base) * 2**attempt) between attempts.
+    """
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            delay = min(cap, random.uniform(base, 2 * base) * (2 ** attempt))
+            print(f"   ⚠️  Retryable error ({str(e)[:100]}), retrying in {delay:.1f}s...", file=sys.stderr)
+            time.sleep(delay)
+
+def wait_ready(studio, total=30, interval=0.25):
+    """
+    Poll the studio with a cheap `pwd` until it answers, for up to `total` seconds.
+    Only one poll is in flight at a time: a slow round trip is waited on until
+    the deadline, and a new poll is only sent after the previous one raised.
+    Returns the output; raises TimeoutError carrying the last error otherwise.
+    """
+    deadline = time.monotonic() + total
+    last_error = None
+    while True:
+        future = submit_daemon(studio.run, "pwd")
+        try:
+            return future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            raise TimeoutError(f"Studio not ready after {total}s: {last_error or 'no answer'}")
+        except Exception as e:
+            last_error = e
+        if deadline - time.monotonic() <= interval:
+            raise TimeoutError(f"Studio not ready after {total}s: {last_error}")
+        time.sleep(interval)
+
+def connect_first(attempts: list):
+    """
+    Run studio connection attempts concurrently instead of one after another.
+    attempts is a list of (label, factory) that all reach the same studio,
+    so the first success wins. Returns (label, studio); raises the last
+    error if every attempt fails.
+    """
+    futures = {submit_daemon(retry, factory): label for label, factory in attempts}
+    pending = set(futures)
+    last_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return futures[future], future.result()
+            except Exception as e:
+                last_error = e
+                print(f"   ✗ {futures[future]} failed: {e}", file=sys.stderr)
+    raise last_error
+
+def partition_commands(commands: list) -> list:
+    """
+    Split commands into serial groups of independent commands.
+    A standalone '||' argument between two commands marks them as
+    independent, e.g. ['pip install a', '||', 'pip install b', 'pytest']
+    runs both installs concurrently, then pytest.
+    """
+    groups = []
+    join_next = False
+    for cmd in commands:
+        if cmd.strip() == PARALLEL_SEPARATOR:
+            join_next = bool(groups)
+            continue
+        if join_next:
+            groups[-1].append(cmd)
+        else:
+            groups.append([cmd])
+        join_next = False
+    return groups
+
+def classify_command(cmd: str) -> Tuple[str, int]:
+    """
+    Classify a command as 'install' | 'test' | 'other' and pick its timeout.
+    Install/download commands gate the rest of the run.
+    """
+    if INSTALL_COMMAND_PATTERN.search(cmd):
+        return 'install', 600  # 10 minutes for installs
+    if TEST_COMMAND_PATTERN.search(cmd):
+        return 'test', 300  # 5 minutes for tests
+    return 'other', 180  # 3 minutes for other commands
+
+def build_run_script(repo_dir: str, groups: list, cmd_classes: list, script_path: str) -> str:
+    """
+    Build one bash script running every command group in order.
+    Each command's merged output is truncated remotely to its last
+    COMMAND_OUTPUT_LIMIT bytes and framed by ##CMD_START/##CMD_END
+    sentinels so parse_run_output can split it back per command.
+    Parallel groups run as background jobs and are reported after `wait`.
+    The script stops after a failed install command, like the old loop did.
+    cmd_classes holds classify_command() results in flattened command order.
+    """
+    lines = ["set -o pipefail", f"cd {shlex.quote(repo_dir)} || exit 1"]
+    index = 0
+    for group in groups:
+        if len(group) == 1:
+            cmd = group[0]
+            cls, timeout_seconds = cmd_classes[index]
+            lines.append(f'echo "##CMD_START {index}"')
+            lines.append(f"timeout {timeout_seconds} bash -c {shlex.quote(cmd)} 2>&1 | tail -c {COMMAND_OUTPUT_LIMIT}")
+            lines.append(f'rc=$?; echo; echo "##CMD_END {index} rc=$rc"')
+            if cls == 'install':
+                lines.append('[ $rc -eq 0 ] || [ $rc -eq 124 ] || exit 0')
+            index += 1
+            continue
+        
+        work_dir = f"{script_path}.d"
+        lines.append(f"mkdir -p {shlex.quote(work_dir)}")
+        for offset, cmd in enumerate(group):
+            out = f"{work_dir}/{index + offset}"
+            timeout_seconds = cmd_classes[index + offset][1]
+            lines.append(
+                f"(timeout {timeout_seconds} bash -c {shlex.quote(cmd)} > {shlex.quote(out + '.out')} 2>&1; "
+                f"echo $? > {shlex.quote(out + '.rc')}) &"
+            )
+        lines.append("wait")
+        lines.append("stop=0")
+        for offset in range(len(group)):
+            out = f"{work_dir}/{index + offset}"
+            lines.append(f'echo "##CMD_START {index + offset}"; tail -c {COMMAND_OUTPUT_LIMIT} {shlex.quote(out + ".out")}')
+            lines.append(f'rc=$(cat {shlex.quote(out + ".rc")}); echo; echo "##CMD_END {index + offset} rc=$rc"')
+            if cmd_classes[index + offset][0] == 'install':
+                lines.append('[ $rc -eq 0 ] || [ $rc -eq 124 ] || stop=1')
+        lines.append(f"rm -rf {shlex.quote(work_dir)}")
+        lines.append('[ $stop -eq 0 ] || exit 0')
+        index += len(group)
+    lines.append("exit 0")
+    return "\n".join(lines)
+
+def parse_run_output(output: str) -> dict:
+    """Split build_run_script output into {index: (output, exit_code)}"""
+    command_results = {}
+    for match in CMD_OUTPUT_PATTERN.finditer(output):
+        command_results[int(match.group(1))] = (match.group(2), int(match.group(3)))
+    return command_results
+
+def check_cli_available() -> Tuple[bool, str]:
+    """Probe the Lightning CLI once per process and cache the result"""
+    global _CLI_AVAILABLE
+    if _CLI_AVAILABLE is None:
+        if shutil.which('lightning') is None:
+            # Binary missing: no need to fork
+            _CLI_AVAILABLE = (False, '')
+        else:
+            cli_check = subprocess.run(['lightning', '--version'],
+                                       capture_output=True, text=True, timeout=10)
+            _CLI_AVAILABLE = (cli_check.returncode == 0, cli_check.stdout.strip())
+    return _CLI_AVAILABLE
 
 def execute_via_cli(repo_url: str, project_name: str, commands: list) -> dict:
     """
@@ -58,36 +289,42 @@ def execute_via_cli(repo_url: str, project_name: str, commands: list) -> dict:
     
     try:
         # Check if CLI is available
-        cli_check = subprocess.run(['lightning', '--version'], 
-                                   capture_output=True, text=True, timeout=10)
-        if cli_check.returncode != 0:
+        cli_available, cli_version = check_cli_available()
+        if not cli_available:
             results['errors'].append("Lightning CLI not available")
             return results
         
-        print(f"   ✓ Lightning CLI available: {cli_check.stdout.strip()}", file=sys.stderr)
+        print(f"   ✓ Lightning CLI available: {cli_version}", file=sys.stderr)
         
         # Create a temporary script to run in studio
         script_content = f"""#!/bin/bash
 set -e
-git clone {repo_url} /teamspace/studios/this_studio/repo
+git clone {shlex.quote(repo_url)} /teamspace/studios/this_studio/repo
 cd /teamspace/studios/this_studio/repo
-{chr(10).join(commands)}
+{chr(10).join(cmd for group in partition_commands(commands) for cmd in group)}
 """
         
-        script_path = f"/tmp/lightning_script_{int(time.time())}.sh"
-        with open(script_path, 'w') as f:
+        # Unique, owner-only script file (no name races between invocations)
+        with tempfile.NamedTemporaryFile('w', prefix='lightning_script_', suffix='.sh', delete=False) as f:
             f.write(script_content)
+            script_path = f.name
+        os.chmod(script_path, 0o700)
         
         # Execute via CLI
         print(f"   Running commands via CLI...", file=sys.stderr)
-        cli_result = subprocess.run(
-            ['lightning', 'run', 'studio', '--script', script_path],
-            capture_output=True,
-            text=True,
-            timeout=600
-        )
-        
-        os.remove(script_path)
+        try:
+            cli_result = subprocess.run(
+                ['lightning', 'run', 'studio', '--script', script_path],
+                capture_output=True,
+                text=True,
+                timeout=600
+            )
+        finally:
+            # Never let cleanup mask the real CLI error
+            try:
+                os.unlink(script_path)
+            except FileNotFoundError:
+                pass
         
         if cli_result.returncode == 0:
             results['success'] = True
@@ -125,7 +362,8 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
     Args:
         repo_url: GitHub repository URL
         project_name: Project name for the studio
-        commands: List of commands to execute
+        commands: List of commands to execute ('||' between two
+            commands lets them run in parallel)
         
     Returns:
         dict: Execution results
@@ -135,13 +373,7 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
     print(f"   Repo: {repo_url}", file=sys.stderr)
     print(f"   Project: {project_name}", file=sys.stderr)
     
-    # Get credentials from environment
-    api_key = os.environ.get('LIGHTNING_API_KEY')
-    user_id = os.environ.get('LIGHTNING_USER_ID')
-    username = os.environ.get('LIGHTNING_USERNAME')  # Username for user parameter
-    teamspace = os.environ.get('LIGHTNING_TEAMSPACE', 'Vision-model')  # Default to Vision-model
-    
-    if not api_key:
+    if not _CFG.api_key:
         return {
             'success': False,
             'outputs': [],
@@ -149,7 +381,7 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
         }
     
     # Need either username or user_id for the user parameter
-    user_param = username or user_id
+    user_param = _CFG.username or _CFG.user_id
     if not user_param:
         return {
             'success': False,
@@ -161,9 +393,6 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
             ]
         }
     
-    # Set the API key for lightning SDK to use
-    os.environ['LIGHTNING_API_KEY'] = api_key
-    
     studio = None
     results = {
         'success': True,
@@ -178,49 +407,77 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
         studio_name = studio_name.replace(' ', '-').lower()  # Make it URL-safe
         
         print(f"⚡ Creating Lightning Studio: {studio_name}", file=sys.stderr)
-        print(f"   Using API key: {api_key[:20]}...", file=sys.stderr)
-        print(f"   Teamspace: {teamspace}", file=sys.stderr)
+        print(f"   Using API key: {_CFG.api_key[:20]}...", file=sys.stderr)
+        print(f"   Teamspace: {_CFG.teamspace}", file=sys.stderr)
         print(f"   User: {user_param}", file=sys.stderr)
         
         # Try multiple approaches to create/connect to studio
         studio_created = False
         last_error = None
         
-        # Approach 1: Try to connect to existing studio first
-        try:
-            print(f"   Attempting to connect to existing studio...", file=sys.stderr)
-            studio = Studio(name=studio_name, teamspace=teamspace, user=user_param)
-            studio_created = True
-            print(f"   ✓ Connected to existing studio", file=sys.stderr)
-        except Exception as e1:
-            last_error = str(e1)
-            print(f"   Studio doesn't exist, creating new one...", file=sys.stderr)
-        
-        # Approach 2: Create new studio if connection failed
-        if not studio_created:
+        # Approach 1: connect to existing studio, 2: create it, 3: personal workspace
+        def connect_existing():
+            return Studio(name=studio_name, teamspace=_CFG.teamspace, user=user_param)
+        
+        def create_new():
+            return Studio(name=studio_name, teamspace=_CFG.teamspace, user=user_param, create_ok=True)
+        
+        def create_personal():
+            return Studio(name=studio_name, create_ok=True)
+        
+        if _CFG.parallel_connect:
+            # Connect and create target the same teamspace studio: race them, so the
+            # worst case is the slowest attempt, not the sum
+            print(f"   Trying existing studio and new studio in parallel...", file=sys.stderr)
             try:
-                print(f"   Creating new studio...", file=sys.stderr)
-                studio = Studio(
-                    name=studio_name,
-                    teamspace=teamspace,
-                    user=user_param,
-                    create_ok=True
-                )
+                label, studio = connect_first([
+                    ('Connect to existing studio', connect_existing),
+                    ('Studio creation', create_new),
+                ])
                 studio_created = True
-                print(f"   ✓ Studio created", file=sys.stderr)
-            except Exception as e2:
-                last_error = str(e2)
-                print(f"   ✗ Studio creation failed: {last_error}", file=sys.stderr)
-                
-                # Approach 3: Try without teamspace (personal workspace)
+                print(f"   ✓ Studio ready ({label})", file=sys.stderr)
+            except Exception as e:
+                last_error = str(e)
+                # Approach 3 stays a last resort: it creates a separate personal studio
                 try:
                     print(f"   Trying personal workspace...", file=sys.stderr)
-                    studio = Studio(name=studio_name, create_ok=True)
+                    studio = retry(create_personal)
                     studio_created = True
                     print(f"   ✓ Studio created in personal workspace", file=sys.stderr)
                 except Exception as e3:
                     last_error = str(e3)
                     print(f"   ✗ All approaches failed", file=sys.stderr)
+        else:
+            # Approach 1: Try to connect to existing studio first
+            try:
+                print(f"   Attempting to connect to existing studio...", file=sys.stderr)
+                studio = retry(connect_existing)
+                studio_created = True
+                print(f"   ✓ Connected to existing studio", file=sys.stderr)
+            except Exception as e1:
+                last_error = str(e1)
+                print(f"   Studio doesn't exist, creating new one...", file=sys.stderr)
+        
+            # Approach 2: Create new studio if connection failed
+            if not studio_created:
+                try:
+                    print(f"   Creating new studio...", file=sys.stderr)
+                    studio = retry(create_new)
+                    studio_created = True
+                    print(f"   ✓ Studio created", file=sys.stderr)
+                except Exception as e2:
+                    last_error = str(e2)
+                    print(f"   ✗ Studio creation failed: {last_error}", file=sys.stderr)
+                
+                    # Approach 3: Try without teamspace (personal workspace)
+                    try:
+                        print(f"   Trying personal workspace...", file=sys.stderr)
+                        studio = retry(create_personal)
+                        studio_created = True
+                        print(f"   ✓ Studio created in personal workspace", file=sys.stderr)
+                    except Exception as e3:
+                        last_error = str(e3)
+                        print(f"   ✗ All approaches failed", file=sys.stderr)
         
         if not studio_created:
             return {
@@ -243,71 +500,90 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
             }
             raise Exception(f"Studio creation failed: {last_error}")
         
-        # Start the Studio with timeout protection
-        print(f"⚡ Starting Studio...", file=sys.stderr)
+        # Warm studios (e.g. reused ones) answer right away: skip start() and its settle time
         studio_started = False
-        
         try:
-            # Try to start studio with timeout
-            def start_studio():
-                studio.start()
-                return True
-            
-            run_with_timeout(start_studio, timeout_seconds=120)
+            run_with_timeout(lambda: studio.run("true"), timeout_seconds=5)
             studio_started = True
-            print(f"   ✓ Studio started successfully", file=sys.stderr)
-            
-            # Give it a moment to fully initialize
-            time.sleep(3)
+            print(f"⚡ Studio already running, skipping start", file=sys.stderr)
+        except Exception:
+            pass
+        
+        # Start the Studio with timeout protection
+        if not studio_started:
+            print(f"⚡ Starting Studio...", file=sys.stderr)
             
-        except TimeoutError:
-            print(f"   ⚠️  Start timed out, assuming studio is already running...", file=sys.stderr)
-            studio_started = True  # Assume it's running
-        except Exception as start_error:
-            print(f"   ⚠️  Start failed: {start_error}", file=sys.stderr)
-            print(f"   Assuming studio may already be running...", file=sys.stderr)
-            studio_started = True  # Try to continue anyway
-        
-        # Test if studio is actually responsive
+            try:
+                # Try to start studio with timeout
+                def start_studio():
+                    studio.start()
+                    return True
+                
+                # Retries share the 120s budget
+                run_with_timeout(lambda: retry(start_studio), timeout_seconds=120)
+                studio_started = True
+                print(f"   ✓ Studio started successfully", file=sys.stderr)
+                
+            except TimeoutError:
+                print(f"   ⚠️  Start timed out, assuming studio is already running...", file=sys.stderr)
+                studio_started = True  # Assume it's running
+            except Exception as start_error:
+                print(f"   ⚠️  Start failed: {start_error}", file=sys.stderr)
+                print(f"   Assuming studio may already be running...", file=sys.stderr)
+                studio_started = True  # Try to continue anyway
+        
+        # Poll until the studio is actually responsive (no fixed settle sleep)
         print(f"⚡ Testing Studio responsiveness...", file=sys.stderr)
         try:
-            def test_studio():
-                return studio.run("echo 'Lightning Studio Ready' && pwd")
-            
-            test_output = run_with_timeout(test_studio, timeout_seconds=30)
+            test_output = wait_ready(studio)
             print(f"   ✓ Studio is responsive!", file=sys.stderr)
             print(f"   Working directory: {test_output.strip()}", file=sys.stderr)
-        except TimeoutError:
-            print(f"   ✗ Studio test timed out", file=sys.stderr)
-            return {
-                'success': False,
-                'outputs': [],
-                'errors': ["Studio is not responsive (timeout)", "Try again or check Lightning AI dashboard"]
-            }
-        except Exception as test_error:
-            print(f"   ✗ Studio test failed: {test_error}", file=sys.stderr)
+        except TimeoutError as test_error:
+            print(f"   ✗ Studio test timed out: {test_error}", file=sys.stderr)
             return {
                 'success': False,
                 'outputs': [],
-                'errors': [f"Studio not responsive: {test_error}"]
+                'errors': [
+                    "Studio is not responsive (timeout)",
+                    f"Studio not responsive: {test_error}",
+                    "Try again or check Lightning AI dashboard"
+                ]
             }
         
         # Clone the repository with timeout
         print(f"⚡ Cloning repository...", file=sys.stderr)
-        repo_dir = f"/teamspace/studios/this_studio/repo-{int(time.time())}"
+        # Slug limited to [a-z0-9._-] so project names can't break or inject into shell commands
+        repo_slug = re.sub(r'[^a-z0-9._-]', '-', studio_name)
+        if _CFG.studio_reuse:
+            # Deterministic per project/repo so repeat runs update in place instead of re-cloning
+            repo_dir = f"/teamspace/studios/this_studio/repo-{repo_slug}"
+        else:
+            # Removed after the run anyway: unique, so concurrent runs never share a tree
+            repo_dir = f"/teamspace/studios/this_studio/repo-{repo_slug}-{uuid.uuid4().hex[:8]}"
+        q_repo_dir = shlex.quote(repo_dir)
         
         try:
             def clone_repo():
-                # Check if directory exists, clean it first
-                cleanup_cmd = f"rm -rf {repo_dir}"
-                studio.run(cleanup_cmd)
-                return studio.run(f"git clone {repo_url} {repo_dir}")
+                # Shallow clone the first time, fetch + reset to the latest commit afterwards.
+                # Fetch from repo_url itself, not the stored origin, so the checkout
+                # always matches the repo we were asked to run.
+                # A checkout that can't be updated (e.g. half-removed by a background
+                # cleanup) is recloned. Output is truncated remotely so only the tail
+                # crosses the wire.
+                return studio.run(
+                    f"set -o pipefail; ("
+                    f"if [ -d {q_repo_dir}/.git ] && (cd {q_repo_dir} && git fetch --depth=1 {shlex.quote(repo_url)} HEAD "
+                    f"&& git reset --hard FETCH_HEAD && git clean -fdx); then :; "
+                    f"else rm -rf {q_repo_dir} && git clone --depth=1 {shlex.quote(repo_url)} {q_repo_dir}; fi"
+                    f") 2>&1 | tail -c {CLONE_OUTPUT_LIMIT}"
+                )
             
-            clone_output = run_with_timeout(clone_repo, timeout_seconds=120)
+            # Retries share the 120s budget
+            clone_output = run_with_timeout(lambda: retry(clone_repo), timeout_seconds=120)
             print(f"   ✓ Clone complete", file=sys.stderr)
             results['outputs'].append({
                 'command': f'git clone {repo_url}',
-                'stdout': clone_output[:1000],  # Limit output size
+                'stdout': clone_output,  # Already truncated remotely
                 'stderr': '',
                 'exitCode': 0,
                 'success': True
@@ -325,95 +601,174 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
             results['errors'].append(f"Git clone failed: {error_msg}")
             return results
         
-        # Change to repo directory and execute commands with timeout
-        for i, cmd in enumerate(commands):
-            print(f"⚡ Executing command {i+1}/{len(commands)}: {cmd}", file=sys.stderr)
-            
-            # Determine timeout based on command type
-            timeout_seconds = 300  # Default 5 minutes
-            if 'install' in cmd.lower() or 'download' in cmd.lower():
-                timeout_seconds = 600  # 10 minutes for installs
-            elif 'test' in cmd.lower():
-                timeout_seconds = 300  # 5 minutes for tests
-            else:
-                timeout_seconds = 180  # 3 minutes for other commands
-            
+        # Run all commands in the repo directory through a single remote script
+        groups = partition_commands(commands)
+        flat_commands = [cmd for group in groups for cmd in group]
+        # Unique per execution so concurrent runs never share a script file
+        script_path = f"/tmp/{os.path.basename(repo_dir)}-{uuid.uuid4().hex[:8]}.sh"
+        q_script_path = shlex.quote(script_path)
+        # Classify once up front: timeout policy and install gating become lookups
+        cmd_classes = [classify_command(cmd) for cmd in flat_commands]
+        script = build_run_script(repo_dir, groups, cmd_classes, script_path)
+        # Serial groups add up, parallel groups cost their slowest command
+        script_timeout = 0
+        index = 0
+        for group in groups:
+            script_timeout += max(timeout_seconds for _, timeout_seconds in cmd_classes[index:index + len(group)])
+            index += len(group)
+        
+        print(f"⚡ Executing {len(flat_commands)} command(s) in one remote script...", file=sys.stderr)
+        for i, cmd in enumerate(flat_commands):
+            print(f"   {i+1}/{len(flat_commands)}: {cmd}", file=sys.stderr)
+        
+        # Upload and run are separate RPCs: only the upload is retried, so a
+        # transient error can never start a second copy of a running script.
+        # The upload writes a temp file and renames it into place, so a late
+        # duplicate upload can't truncate a script bash is already reading.
+        def upload_script():
+            return studio.run(
+                f"cat > {q_script_path}.$$ <<'{SCRIPT_EOF}'\n{script}\n{SCRIPT_EOF}\n"
+                f"mv {q_script_path}.$$ {q_script_path}"
+            )
+        
+        def run_script():
+            return studio.run(f"bash {q_script_path}; rc=$?; rm -f {q_script_path}; exit $rc")
+        
+        command_results = {}
+        script_error = None
+        try:
+            # Same retry policy as the rest of the module: one quick retry on transient errors
+            retry(lambda: run_with_timeout(upload_script, timeout_seconds=30), attempts=2, base=1)
+        except TimeoutError:
+            script_error = (1, "Command script upload timed out after 30s")
+        except Exception as e:
+            script_error = (1, f"Command script upload failed: {str(e)[:500]}")
+        
+        if script_error:
+            results['success'] = False
+        else:
             try:
-                # Execute in the repo directory with timeout
-                full_cmd = f"cd {repo_dir} && timeout {timeout_seconds} {cmd}"
-                
-                def run_cmd():
-                    return studio.run(full_cmd)
-                
-                output = run_with_timeout(run_cmd, timeout_seconds=timeout_seconds + 30)
-                
-                results['outputs'].append({
-                    'command': cmd,
-                    'stdout': output[:5000],  # Limit to 5KB per command
-                    'stderr': '',
-                    'exitCode': 0,
-                    'success': True
-                })
-                
-                print(f"   ✓ Command succeeded", file=sys.stderr)
-                print(f"   Output preview: {output[:200]}", file=sys.stderr)
-                
+                # Remote `timeout` already kills each command; only allow a little IPC slack
+                script_output = run_with_timeout(run_script, timeout_seconds=script_timeout + 5)
+                command_results = parse_run_output(script_output)
             except TimeoutError:
-                error_msg = f"Command timed out after {timeout_seconds}s"
-                print(f"   ✗ {error_msg}", file=sys.stderr)
-                
-                # Don't fail completely on timeout, mark as partial success
-                results['outputs'].append({
-                    'command': cmd,
-                    'stdout': '',
-                    'stderr': error_msg,
-                    'exitCode': 124,  # Standard timeout exit code
-                    'success': False
-                })
-                results['errors'].append(f"Command '{cmd}' {error_msg}")
-                # Continue with next command instead of breaking
-                
+                script_error = (124, f"Command script timed out after {script_timeout}s")
             except Exception as e:
-                error_msg = str(e)
-                print(f"   ✗ Command failed: {error_msg[:200]}", file=sys.stderr)
-                
-                results['outputs'].append({
+                script_error = (1, f"Command script failed: {str(e)[:500]}")
+                results['success'] = False
+        
+        if script_error:
+            print(f"   ✗ {script_error[1][:200]}", file=sys.stderr)
+            results['errors'].append(script_error[1])
+        
+        # Bounded outputs: the first failures plus the most recent entries, so the
+        # payload size doesn't grow with the number of commands. Entries carry
+        # their command index so the kept ones stay in command order; per-command
+        # error messages are keyed the same way and only kept for kept entries.
+        first_failures = []
+        command_errors = {}
+        recent = deque(maxlen=_CFG.max_outputs)
+        install_succeeded = False
+        
+        def record(entry, cls):
+            nonlocal install_succeeded, recorded
+            recent.append((recorded, entry))
+            if not entry['success'] and len(first_failures) < MAX_FIRST_FAILURES:
+                first_failures.append((recorded, entry))
+            recorded += 1
+            install_succeeded = install_succeeded or (entry['success'] and cls == 'install')
+            return recorded - 1
+        
+        recorded = 0
+        stopped_early = False
+        for i, cmd in enumerate(flat_commands):
+            cls, timeout_seconds = cmd_classes[i]
+            if i not in command_results:
+                # Skipped on purpose: the script stops after a failed install
+                if stopped_early and not script_error:
+                    continue
+                # Otherwise the script failed as a whole or never reported this command
+                error_code, error_msg = script_error or (1, "No output reported for this command")
+                index = record({
                     'command': cmd,
                     'stdout': '',
                     'stderr': error_msg[:2000],
-                    'exitCode': 1,
+                    'exitCode': error_code,
                     'success': False
-                })
-                results['errors'].append(f"Command '{cmd}' failed: {error_msg[:500]}")
-                
-                # For install failures, stop. For test failures, continue
-                if 'install' in cmd.lower() or 'download' in cmd.lower():
+                }, cls)
+                if not script_error:
+                    print(f"   ✗ {cmd}: {error_msg}", file=sys.stderr)
+                    command_errors[index] = f"Command '{cmd}': {error_msg}"
                     results['success'] = False
-                    break
+                continue
+            
+            output, exit_code = command_results[i]
+            index = record({
+                'command': cmd,
+                'stdout': output,  # Already truncated remotely to 5KB
+                'stderr': f"Command timed out after {timeout_seconds}s" if exit_code == 124 else '',
+                'exitCode': exit_code,
+                'success': exit_code == 0
+            }, cls)
+            
+            if exit_code == 0:
+                print(f"   ✓ Command succeeded: {cmd}", file=sys.stderr)
+                print(f"   Output preview: {output[:200]}", file=sys.stderr)
+            elif exit_code == 124:
+                # Don't fail completely on timeout, mark as partial success
+                print(f"   ✗ {cmd}: timed out after {timeout_seconds}s", file=sys.stderr)
+                command_errors[index] = f"Command '{cmd}' timed out after {timeout_seconds}s"
+            else:
+                print(f"   ✗ Command failed: {cmd} (exit code {exit_code})", file=sys.stderr)
+                command_errors[index] = f"Command '{cmd}' failed with exit code {exit_code}: {output[-500:]}"
+                # For install failures, the script stops. For test failures, it continues
+                if cls == 'install':
+                    results['success'] = False
+                    stopped_early = True
+        
+        # Nothing is dropped unless recorded > max_outputs; the last entry is always the last command
+        kept = dict(first_failures)
+        kept.update(recent)
+        command_outputs = [kept[index] for index in sorted(kept)]
+        results['outputs'].extend(command_outputs)
+        results['errors'].extend(command_errors[index] for index in sorted(command_errors) if index in kept)
+        if recorded > len(command_outputs):
+            omitted_errors = sum(1 for index in command_errors if index not in kept)
+            results['errors'].append(
+                f"Note: {recorded - len(command_outputs)} command outputs omitted"
+                + (f" ({omitted_errors} of them failed)" if omitted_errors else "")
+                + f" (LIGHTNING_MAX_OUTPUTS={_CFG.max_outputs})"
+            )
         
         # Stop the Studio with graceful cleanup
         print(f"⚡ Cleaning up Studio...", file=sys.stderr)
-        try:
-            # Clean up the repo directory
-            cleanup_cmd = f"rm -rf {repo_dir}"
-            studio.run(cleanup_cmd)
-            print(f"   ✓ Workspace cleaned", file=sys.stderr)
-        except Exception as cleanup_error:
-            print(f"   ⚠️  Cleanup warning: {cleanup_error}", file=sys.stderr)
+        if _CFG.studio_reuse:
+            # Keep the checkout so the next run only fetches the delta
+            print(f"   ✓ Workspace kept for reuse", file=sys.stderr)
+        else:
+            try:
+                # Clean up the repo directory in the background so it overlaps with stop()
+                cleanup_cmd = f"(rm -rf {q_repo_dir} &) >/dev/null 2>&1"
+                studio.run(cleanup_cmd)
+                print(f"   ✓ Workspace cleanup started", file=sys.stderr)
+            except Exception as cleanup_error:
+                print(f"   ⚠️  Cleanup warning: {cleanup_error}", file=sys.stderr)
         
-        try:
-            studio.stop()
-            print(f"   ✓ Studio stopped", file=sys.stderr)
-        except Exception as stop_error:
-            print(f"   ⚠️  Stop warning: {stop_error}", file=sys.stderr)
-            # Not critical if stop fails
+        if _CFG.studio_reuse:
+            print(f"   ✓ Studio left running for reuse", file=sys.stderr)
+        else:
+            try:
+                studio.stop()
+                print(f"   ✓ Studio stopped", file=sys.stderr)
+            except Exception as stop_error:
+                print(f"   ⚠️  Stop warning: {stop_error}", file=sys.stderr)
+                # Not critical if stop fails
         
         print(f"✓ Lightning execution complete", file=sys.stderr)
         
         # Mark as at least partial success if we got some results
         if len(results['outputs']) > 0 and not results['success']:
             # If we have outputs but success=False, check if install succeeded
-            install_succeeded = any(o['success'] and ('install' in o['command'].lower()) for o in results['outputs'])
             if install_succeeded:
                 results['success'] = True  # Partial success is still success
                 results['errors'].append("Note: Some commands failed but installation succeeded")
@@ -428,15 +783,14 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
         results['errors'].append(f"Lightning SDK execution failed: {error_msg}")
         
         # Try to cleanup
-        if studio:
+        if studio and not _CFG.studio_reuse:
             try:
                 studio.stop()
             except:
                 pass
         
         # FALLBACK: Try CLI execution if SDK fails
-        use_cli_fallback = os.environ.get('LIGHTNING_USE_CLI_FALLBACK', 'true').lower() == 'true'
-        if use_cli_fallback:
+        if _CFG.use_cli_fallback:
             print(f"⚡ Attempting CLI fallback...", file=sys.stderr)
             cli_results = execute_via_cli(repo_url, project_name, commands)
             if cli_results['success']:
@@ -449,6 +803,17 @@ def execute_in_cloud(repo_url: str, project_name: str, commands: list) -> dict:
         return results
 
 
+def write_json(results: dict):
+    """Write results as one JSON line to stdout (orjson when available)"""
+    if orjson is None:
+        print(json.dumps(results))
+        return
+    sys.stdout.flush()
+    sys.stdout.buffer.write(orjson.dumps(results, option=orjson.OPT_NON_STR_KEYS))
+    sys.stdout.buffer.write(b"\n")
+    sys.stdout.buffer.flush()
+
+
 def main():
     """Main entry point"""
     
@@ -456,7 +821,7 @@ def main():
         print(json.dumps({
             'success': False,
             'outputs': [],
-            'errors': ['Usage: lightning_executor.py <repo_url> <project_name> <command1> [command2] ...']
+            'errors': ['Usage: lightning_executor.py <repo_url> <project_name> <command1> [||] [command2] ...']
         }))
         sys.exit(1)
     
@@ -467,7 +832,7 @@ def main():
     results = execute_in_cloud(repo_url, project_name, commands)
     
     # Output JSON result to stdout
-    print(json.dumps(results))
+    write_json(results)
     
     sys.exit(0 if results['success'] else 1)
 
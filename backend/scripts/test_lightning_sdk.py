@@ -5,6 +5,7 @@ Test Lightning SDK directly to see what methods are available
 
 import os
 import sys
+import asyncio
 
 # Set credentials
 os.environ['LIGHTNING_API_KEY'] = os.getenv('LIGHTNING_API_KEY', '')
@@ -14,72 +15,101 @@ if not os.environ['LIGHTNING_API_KEY']:
 
 from lightning_sdk import Studio, Machine
 
-print("Testing Lightning SDK...")
-print()
-
-# Create studio
-print("1. Creating Studio...")
-try:
-    studio = Studio(
-        name="test-debug-studio",
-        teamspace="Vision-model",
-        user="bilgeealtangerel",  # Added user parameter
-        create_ok=True
+
+def create_studio():
+    """1. Create studio"""
+    print("1. Creating Studio...")
+    try:
+        studio = Studio(
+            name="test-debug-studio",
+            teamspace="Vision-model",
+            user="bilgeealtangerel",  # Added user parameter
+            create_ok=True
+        )
+        print("   ✓ Studio object created")
+        print(f"   Studio type: {type(studio)}")
+        print(f"   Studio methods: {[m for m in dir(studio) if not m.startswith('_')][:20]}")
+        return studio
+    except Exception as e:
+        print(f"   ✗ Failed: {e}")
+        sys.exit(1)
+
+
+def check_status(studio):
+    """2. Check studio status (read-only, doesn't need start)"""
+    lines = ["2. Checking Studio status..."]
+    try:
+        if hasattr(studio, 'status'):
+            lines.append(f"   Status: {studio.status}")
+        if hasattr(studio, 'state'):
+            lines.append(f"   State: {studio.state}")
+        if hasattr(studio, 'is_running'):
+            lines.append(f"   Is running: {studio.is_running}")
+    except Exception as e:
+        lines.append(f"   ⚠️  Status check: {e}")
+    return lines
+
+
+def start_studio(studio):
+    """3. Try to start"""
+    lines = ["3. Starting Studio..."]
+    try:
+        studio.start()
+        lines.append("   ✓ Start() completed")
+    except Exception as e:
+        lines.append(f"   ✗ Start failed: {e}")
+        lines.append(f"   Error type: {type(e).__name__}")
+    return lines
+
+
+def run_command(studio):
+    """4. Check if we can run commands"""
+    print("4. Testing run() method...")
+    try:
+        output = studio.run("echo 'Hello from Lightning!'")
+        print(f"   ✓ Command executed")
+        print(f"   Output: {output[:100]}")
+    except Exception as e:
+        print(f"   ✗ Run failed: {e}")
+        print(f"   Error type: {type(e).__name__}")
+
+
+def stop_studio(studio):
+    """5. Try stop"""
+    print("5. Stopping Studio...")
+    try:
+        studio.stop()
+        print("   ✓ Studio stopped")
+    except Exception as e:
+        print(f"   ⚠️  Stop: {e}")
+
+
+async def main():
+    print("Testing Lightning SDK...")
+    print()
+
+    studio = create_studio()
+    print()
+
+    # Status is read-only, so it runs alongside the slow start()
+    print("Running steps 2 and 3 concurrently (start may take 30-60 seconds)...")
+    print()
+    loop = asyncio.get_running_loop()
+    status_lines, start_lines = await asyncio.gather(
+        loop.run_in_executor(None, check_status, studio),
+        loop.run_in_executor(None, start_studio, studio),
     )
-    print("   ✓ Studio object created")
-    print(f"   Studio type: {type(studio)}")
-    print(f"   Studio methods: {[m for m in dir(studio) if not m.startswith('_')][:20]}")
-except Exception as e:
-    print(f"   ✗ Failed: {e}")
-    sys.exit(1)
+    for lines in (status_lines, start_lines):
+        print("\n".join(lines))
+        print()
+
+    run_command(studio)
+    print()
+
+    stop_studio(studio)
+    print()
+    print("Test complete!")
 
-print()
-
-# Check studio status
-print("2. Checking Studio status...")
-try:
-    if hasattr(studio, 'status'):
-        print(f"   Status: {studio.status}")
-    if hasattr(studio, 'state'):
-        print(f"   State: {studio.state}")
-    if hasattr(studio, 'is_running'):
-        print(f"   Is running: {studio.is_running}")
-except Exception as e:
-    print(f"   ⚠️  Status check: {e}")
-
-print()
-
-# Try to start
-print("3. Starting Studio (this may take 30-60 seconds)...")
-try:
-    studio.start()
-    print("   ✓ Start() completed")
-except Exception as e:
-    print(f"   ✗ Start failed: {e}")
-    print(f"   Error type: {type(e).__name__}")
-
-print()
-
-# Check if we can run commands
-print("4. Testing run() method...")
-try:
-    output = studio.run("echo 'Hello from Lightning!'")
-    print(f"   ✓ Command executed")
-    print(f"   Output: {output[:100]}")
-except Exception as e:
-    print(f"   ✗ Run failed: {e}")
-    print(f"   Error type: {type(e).__name__}")
-
-print()
-
-# Try stop
-print("5. Stopping Studio...")
-try:
-    studio.stop()
-    print("   ✓ Studio stopped")
-except Exception as e:
-    print(f"   ⚠️  Stop: {e}")
-
-print()
-print("Test complete!")
 
+if __name__ == '__main__':
+    asyncio.run(main())